@@ -2,9 +2,16 @@ import os
 import json
 import re
 import argparse
+import csv
+import io
+import itertools
 import logging
+import mmap
+import time
+import warnings
 import difflib
-from typing import Optional, Tuple
+from functools import lru_cache
+from typing import IO, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -12,13 +19,29 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import pycountry
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 import folium
 from branca.colormap import linear
 from branca.element import MacroElement, Template
 
+try:
+    import orjson  # optional; falls back to the stdlib json module
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa  # optional; falls back to pandas I/O
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as pa_feather
+except ImportError:
+    pa = pc = pa_csv = pa_feather = None
+
+try:
+    from rapidfuzz import fuzz as _rf_fuzz, process as _rf_process
+except ImportError:  # optional; falls back to difflib
+    _rf_fuzz = _rf_process = None
+
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("AidMind")
@@ -33,35 +56,107 @@ def _requests_session() -> requests.Session:
         allowed_methods=["GET", "HEAD"],
         raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retries)
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=20, pool_maxsize=20)
     s.mount("http://", adapter)
     s.mount("https://", adapter)
     return s
 
 
+# Downloaded boundaries are re-validated with the server (ETag/Last-Modified) after this many seconds
+_GEOJSON_CACHE_TTL = 7 * 24 * 3600
+
+# Shared session so the metadata and GeoJSON requests (and repeated runs) reuse
+# pooled connections instead of paying a new TCP+TLS handshake each time
+_SESSION = _requests_session()
+
+# Re-validating an existing cache is optional, so it gets a single attempt without the
+# retry/backoff above: offline runs fall back to the cached copy immediately
+_REVALIDATE_SESSION = requests.Session()
+
+
+_SUFFIX_RE = re.compile(r"[_-]\d+$")
+_WS_RE = re.compile(r"\s+")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9\s]+")
+# Deletes ASCII punctuation/symbols in one C-level pass; non-ASCII input still goes through _NON_ALNUM_RE
+_ASCII_PUNCT_TABLE = str.maketrans("", "", "".join(
+    chr(c) for c in range(128) if not (chr(c).isalnum() or chr(c).isspace())
+))
+
+# RE2 spellings of the patterns above for pyarrow.compute, valid for ASCII input only.
+# RE2's \s omits \v and \x1c-\x1f, so Python's ASCII whitespace class is written out.
+_PA_WS_CHARS = " \t\n\x0b\x0c\r\x1c\x1d\x1e\x1f"
+_PA_WS = r"[\t\n\x0b\x0c\r\x1c-\x1f ]+"
+_PA_NON_ALNUM = r"[^a-z0-9\t\n\x0b\x0c\r\x1c-\x1f ]+"
+_PA_SUFFIX = r"[_-][0-9]+$"
+
+
+def _ascii_arrow(values):
+    # Arrow string array (nulls -> "nan") when every value is an ASCII string, else None.
+    # Such columns are normalized by pyarrow's RE2 kernels over the whole buffer instead
+    # of one Python re call per name; anything else takes the .str/re path.
+    if pa is None:
+        return None
+    try:
+        arr = pa.array(values, type=pa.large_string(), from_pandas=True)
+    except (pa.ArrowException, TypeError, ValueError):
+        return None
+    arr = pc.fill_null(arr, "nan")
+    if not pc.all(pc.string_is_ascii(arr)).as_py():
+        return None
+    return arr
+
+
+def _arrow_to_series(arr, index) -> pd.Series:
+    return pd.Series(arr.to_pandas().array, index=index, dtype="str")
+
+
 def _strip_suffix_unit(name: str) -> str:
     # Collapse entries like 'Kabul_1' or 'Kabul-2' to 'Kabul'
     if not isinstance(name, str):
         name = str(name)
-    name = re.sub(r"[_-]\d+$", "", name.strip())
-    name = re.sub(r"\s+", " ", name)
+    name = _SUFFIX_RE.sub("", name.strip())
+    name = _WS_RE.sub(" ", name)
     return name
 
 
-def _detect_admin_column(df: pd.DataFrame) -> Optional[str]:
-    candidates = [
-        "province",
-        "admin1",
-        "admin_1",
-        "region",
-        "state",
-        "adm1_name",
-        "name",
-    ]
-    lower_cols = {c.lower(): c for c in df.columns}
-    for key in candidates:
+def _strip_suffix_series(s: pd.Series) -> pd.Series:
+    # Vectorized _strip_suffix_unit over a whole column
+    arr = _ascii_arrow(s)
+    if arr is not None:
+        arr = pc.replace_substring_regex(pc.ascii_trim(arr, _PA_WS_CHARS), _PA_SUFFIX, "")
+        return _arrow_to_series(pc.replace_substring_regex(arr, _PA_WS, " "), s.index)
+    s = pd.Series(s, dtype=object)
+    s = s.where(s.notna(), "nan").astype(str).str.strip()
+    return s.str.replace(_SUFFIX_RE, "", regex=True).str.replace(_WS_RE, " ", regex=True)
+
+
+# Admin column names tried in priority order (already lowercase)
+_ADMIN_CANDIDATES = (
+    "province",
+    "admin1",
+    "admin_1",
+    "region",
+    "state",
+    "adm1_name",
+    "name",
+)
+
+
+@lru_cache(maxsize=64)
+def _admin_column_by_name(columns: tuple) -> Optional[str]:
+    # Name-based part of the detection, memoized per schema (a recurring set of
+    # column names is matched once rather than re-lowercased on every call)
+    lower_cols = {c.lower(): c for c in columns}
+    for key in _ADMIN_CANDIDATES:
         if key in lower_cols:
             return lower_cols[key]
+    return None
+
+
+def _detect_admin_column(df: pd.DataFrame) -> Optional[str]:
+    by_name = _admin_column_by_name(tuple(df.columns))
+    if by_name is not None:
+        return by_name
     # Fallback: choose the first non-numeric column
     for c in df.columns:
         if not pd.api.types.is_numeric_dtype(df[c]):
@@ -72,13 +167,72 @@ def _detect_admin_column(df: pd.DataFrame) -> Optional[str]:
 def _normalize_name(s: str) -> str:
     if not isinstance(s, str):
         s = str(s)
-    s = s.strip().lower()
-    s = re.sub(r"[^a-z0-9\s]", "", s)
-    s = re.sub(r"\s+", " ", s)
+    s = s.strip().lower().translate(_ASCII_PUNCT_TABLE)
+    if not s.isascii():
+        s = _NON_ALNUM_RE.sub("", s)
+    s = _WS_RE.sub(" ", s)
     return s
 
 
+def _normalize_series(values) -> pd.Series:
+    # Vectorized _normalize_name over a Series/list of names via the .str accessor
+    arr = _ascii_arrow(values)
+    if arr is not None:
+        arr = pc.ascii_lower(pc.ascii_trim(arr, _PA_WS_CHARS))
+        arr = pc.replace_substring_regex(arr, _PA_NON_ALNUM, "")
+        index = values.index if isinstance(values, pd.Series) else None
+        return _arrow_to_series(pc.replace_substring_regex(arr, _PA_WS, " "), index)
+    s = pd.Series(values, dtype=object)
+    s = s.where(s.notna(), "nan").astype(str)
+    s = s.str.strip().str.lower().str.replace(_NON_ALNUM_RE, "", regex=True)
+    return s.str.replace(_WS_RE, " ", regex=True)
+
+
+def _closest_names(names: list, choices: list, cutoff: float = 0.84) -> list:
+    # Map each name to itself if it is an exact choice, else to its closest choice
+    # scoring >= cutoff (similarity ratio in 0..1), else leave it unchanged.
+    choice_set = set(choices)
+    mapped = list(names)
+    missing = [i for i, nm in enumerate(names) if nm not in choice_set]
+    if not missing or not choices:
+        return mapped
+    if _rf_process is not None:
+        # rapidfuzz's Indel ratio is an upper bound on difflib's Ratcliff/Obershelp ratio,
+        # so one cdist call prunes the choices and difflib scores only the survivors. The
+        # result (including difflib's tie-break on the greatest name) is exactly the
+        # fallback's, whether or not rapidfuzz is installed.
+        queries = [names[i] for i in missing]
+        scores = _rf_process.cdist(queries, choices, scorer=_rf_fuzz.ratio, workers=-1)
+        survivors = scores >= cutoff * 100 - 1e-6
+        for i, row in zip(missing, survivors):
+            idx = np.flatnonzero(row)
+            if idx.size:
+                match = difflib.get_close_matches(names[i], [choices[j] for j in idx], n=1, cutoff=cutoff)
+                if match:
+                    mapped[i] = match[0]
+    else:
+        for i in missing:
+            match = difflib.get_close_matches(names[i], choices, n=1, cutoff=cutoff)
+            if match:
+                mapped[i] = match[0]
+    return mapped
+
+
+# Exact lookups (name, official/common name, alpha-2, alpha-3) resolved without fuzzy search
+_ISO3_DIRECT = {}
+for _c in pycountry.countries:
+    for _attr in ("name", "official_name", "common_name", "alpha_2", "alpha_3"):
+        _val = getattr(_c, _attr, None)
+        if _val:
+            _ISO3_DIRECT.setdefault(_val.lower(), _c.alpha_3)
+del _c, _attr, _val
+
+
+@lru_cache(maxsize=None)
 def _country_to_iso3(country_name: str) -> str:
+    direct = _ISO3_DIRECT.get(str(country_name).strip().lower())
+    if direct:
+        return direct
     try:
         country = pycountry.countries.search_fuzzy(country_name)[0]
         return country.alpha_3
@@ -86,29 +240,181 @@ def _country_to_iso3(country_name: str) -> str:
         raise ValueError(f"Could not resolve country name to ISO3: {country_name}")
 
 
+def _loads_json(raw: bytes):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson is strict RFC 8259; the stdlib json module also accepts the
+            # NaN/Infinity tokens that json.dump writes by default, so retry with it
+            pass
+    return json.loads(raw if isinstance(raw, (bytes, str)) else bytes(raw))
+
+
+def _read_json(path: str):
+    with open(path, "rb") as f:
+        if orjson is None or os.fstat(f.fileno()).st_size == 0:
+            return _loads_json(f.read())
+        # Parse straight from the page cache instead of copying the file into a bytes object
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+            return _loads_json(mv)
+
+
+def _write_json(path: str, data) -> None:
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data))
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+
+def _write_csv(df: pd.DataFrame, path: str) -> None:
+    # Arrow's multi-threaded C++ writer when available, pandas otherwise
+    if pa_csv is not None:
+        try:
+            # Arrow prints whole floats without a decimal point ("1" for 1.0), so float
+            # columns are pre-formatted the way to_csv does it: shortest repr, NaN -> ""
+            floats = {}
+            for c in df.columns:
+                if pd.api.types.is_float_dtype(df[c]):
+                    dtype = df[c].dtype if isinstance(df[c].dtype, np.dtype) else np.float64
+                    vals = df[c].to_numpy(dtype=dtype, na_value=np.nan)
+                    text = vals.astype(str)
+                    text[np.isnan(vals)] = ""
+                    floats[c] = text
+            table = pa.Table.from_pandas(df.assign(**floats) if floats else df, preserve_index=False)
+            # Header via the csv module so it is quoted the way pandas would; unquoted
+            # values (normalized names, numbers, levels) keep the output pandas-identical
+            header = io.StringIO()
+            csv.writer(header, lineterminator="\n").writerow(df.columns)
+            with open(path, "wb") as f:
+                f.write(header.getvalue().encode("utf-8"))
+                pa_csv.write_csv(
+                    table, f, write_options=pa_csv.WriteOptions(include_header=False, quoting_style="none")
+                )
+            return
+        except Exception as e:
+            logger.debug("pyarrow CSV writer failed, falling back to pandas: %s", e)
+    df.to_csv(path, index=False)
+
+
+def _geojson_cache_path(iso3: str) -> str:
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "geoboundaries")
+    return os.path.join(cache_dir, f"{iso3}_ADM1.geojson")
+
+
+def _cache_meta_path(cache_path: str) -> str:
+    return os.path.splitext(cache_path)[0] + "_meta.json"
+
+
+def _download_geojson(
+    gj_url: str,
+    cache_path: str,
+    validators: Optional[dict] = None,
+    session: Optional[requests.Session] = None,
+) -> Optional[dict]:
+    # Returns the parsed GeoJSON, or None when the server answers 304 Not Modified
+    # to the conditional headers built from ``validators`` (stored ETag/Last-Modified).
+    session = session or _SESSION
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    logger.info("Downloading GeoJSON: %s", gj_url)
+    # Stream the body straight into the cache file and parse it from disk, rather than
+    # holding the response in memory and re-serializing it.
+    part_path = cache_path + ".part"
+    with session.get(gj_url, headers=headers, stream=True, timeout=60) as gj:
+        if headers and gj.status_code == 304:
+            return None
+        gj.raise_for_status()
+        meta = {
+            "url": gj_url,
+            "etag": gj.headers.get("ETag"),
+            "last_modified": gj.headers.get("Last-Modified"),
+            "checked": time.time(),
+        }
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in gj.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+            os.replace(part_path, cache_path)
+            logger.info("Cached boundaries to: %s", cache_path)
+        except requests.RequestException:
+            # A network failure mid-stream is not a caching problem (requests' errors
+            # subclass IOError, so this must come first): clean up and propagate
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        except OSError:
+            # File errors only (open/write/replace): serve this run without the cache
+            logger.warning("Could not cache GeoJSON to: %s", cache_path)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            gj = session.get(gj_url, timeout=60)
+            gj.raise_for_status()
+            return _loads_json(gj.content)
+    try:
+        _write_json(_cache_meta_path(cache_path), meta)
+    except Exception:
+        logger.warning("Could not write cache metadata for: %s", cache_path)
+    return _read_json(cache_path)
+
+
 def _fetch_admin1_geojson(iso3: str, admin_level: str = "ADM1", local_path: Optional[str] = None) -> dict:
     if local_path and os.path.exists(local_path):
         try:
-            with open(local_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = _read_json(local_path)
             logger.info("Loaded boundaries from local file: %s", local_path)
             return data
         except Exception as e:
             logger.warning("Failed to read local GeoJSON at %s: %s; falling back to remote.", local_path, e)
-    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "geoboundaries")
-    os.makedirs(cache_dir, exist_ok=True)
-    cache_path = os.path.join(cache_dir, f"{iso3}_ADM1.geojson")
+    cache_path = _geojson_cache_path(iso3)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
 
     if os.path.exists(cache_path):
+        # Caches without validators (e.g. shipped or pre-existing files) are used as-is.
+        # Otherwise re-validate with a conditional GET once the TTL has expired; a 304
+        # costs one round-trip and no body transfer.
+        validators = None
+        meta_path = _cache_meta_path(cache_path)
+        if os.path.exists(meta_path):
+            try:
+                validators = _read_json(meta_path)
+            except Exception:
+                logger.warning("Failed to read cache metadata, ignoring: %s", meta_path)
+        stale = (
+            validators
+            and validators.get("url")
+            and (validators.get("etag") or validators.get("last_modified"))
+            and time.time() - float(validators.get("checked", 0)) > _GEOJSON_CACHE_TTL
+        )
+        if stale:
+            try:
+                data = _download_geojson(validators["url"], cache_path, validators, session=_REVALIDATE_SESSION)
+                if data is not None:
+                    return data
+                logger.info("Cached boundaries are up to date: %s", cache_path)
+            except requests.RequestException as e:
+                logger.warning("Could not re-validate cached GeoJSON, using cached copy: %s", e)
+            # Restart the TTL on success and failure alike, so an offline run does not
+            # pay a network attempt on every call until the server is reachable again
+            validators["checked"] = time.time()
+            try:
+                _write_json(meta_path, validators)
+            except Exception:
+                logger.warning("Could not write cache metadata for: %s", cache_path)
         try:
-            with open(cache_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = _read_json(cache_path)
             logger.info("Loaded boundaries from cache: %s", cache_path)
             return data
         except Exception:
             logger.warning("Failed to read cached GeoJSON, will refetch: %s", cache_path)
 
-    session = _requests_session()
+    session = _SESSION
     api_url = f"https://www.geoboundaries.org/api/current/gbOpen/{iso3}/{admin_level}"
     logger.info("Fetching boundaries metadata: %s", api_url)
     r = session.get(api_url, timeout=30)
@@ -119,35 +425,214 @@ def _fetch_admin1_geojson(iso3: str, admin_level: str = "ADM1", local_path: Opti
     gj_url = meta.get("gjDownloadURL") or meta.get("gjDownloadURLzipped")
     if not gj_url:
         raise RuntimeError("GeoBoundaries API did not return a GeoJSON URL.")
-    logger.info("Downloading GeoJSON: %s", gj_url)
-    gj = session.get(gj_url, timeout=60)
-    gj.raise_for_status()
-    data = gj.json()
-    try:
-        with open(cache_path, "w", encoding="utf-8") as f:
-            json.dump(data, f)
-        logger.info("Cached boundaries to: %s", cache_path)
-    except Exception:
-        logger.warning("Could not cache GeoJSON to: %s", cache_path)
-    return data
+    return _download_geojson(gj_url, cache_path)
+
+
+def _iter_coord_arrays(geometry: dict):
+    # Yield (N, 2) lon/lat arrays for every coordinate sequence in a GeoJSON geometry
+    if not geometry:
+        return
+    if geometry.get("type") == "GeometryCollection":
+        for g in geometry.get("geometries", []):
+            yield from _iter_coord_arrays(g)
+        return
+    stack = [geometry.get("coordinates") or []]
+    while stack:
+        coords = stack.pop()
+        if not coords:
+            continue
+        if isinstance(coords[0], (int, float)):
+            yield np.asarray([coords[:2]], dtype=np.float64)
+        elif isinstance(coords[0][0], (int, float)):
+            yield np.asarray([c[:2] for c in coords], dtype=np.float64)
+        else:
+            stack.extend(coords)
 
 
-def _prepare_features(df: pd.DataFrame, id_col: str) -> Tuple[pd.DataFrame, np.ndarray, pd.DataFrame]:
-    # Keep only numeric columns for ML features (coerce to numeric to detect)
-    candidate_cols = [c for c in df.columns if c != id_col]
-    numeric_mask = {}
-    for c in candidate_cols:
+def _geojson_bbox_center(geojson: dict) -> Optional[Tuple[float, float]]:
+    # (lat, lon) center of the bounding box of all features, None without any geometry.
+    # Only used to position the map, so no topologically exact centroid is needed.
+    lo = np.array([np.inf, np.inf])
+    hi = np.array([-np.inf, -np.inf])
+    found = False
+    for f in geojson.get("features", []):
+        arrays = list(_iter_coord_arrays(f.get("geometry")))
+        if not arrays:
+            continue
+        xy = np.concatenate(arrays)
+        lo = np.minimum(lo, xy.min(axis=0))
+        hi = np.maximum(hi, xy.max(axis=0))
+        found = True
+    if not found:
+        return None
+    lon, lat = (lo + hi) / 2.0
+    return (float(lat), float(lon))
+
+
+def _load_map_center(geojson: dict, cache_path: Optional[str] = None) -> Tuple[float, float]:
+    # Boundaries never change per cached ISO3, so keep their centroids in a sidecar
+    # JSON next to the GeoJSON cache and skip the geometry work on later runs.
+    sidecar = os.path.splitext(cache_path)[0] + "_centroids.json" if cache_path else None
+    if sidecar and os.path.exists(sidecar) and os.path.exists(cache_path):
         try:
-            pd.to_numeric(df[c], errors="raise")
-            numeric_mask[c] = True
+            if os.path.getmtime(sidecar) >= os.path.getmtime(cache_path):
+                lat, lon = _read_json(sidecar)["center"]
+                return (float(lat), float(lon))
         except Exception:
-            numeric_mask[c] = False
-    feature_cols = [c for c in candidate_cols if numeric_mask.get(c, False)]
+            logger.warning("Failed to read cached centroids, will recompute: %s", sidecar)
+
+    center = _geojson_bbox_center(geojson)
+    if center is None:
+        return (0.0, 0.0)
+    if sidecar:
+        try:
+            _write_json(sidecar, {"center": list(center)})
+        except Exception:
+            logger.warning("Could not cache centroids to: %s", sidecar)
+    return center
+
+
+# CSVs larger than this are streamed in chunks rather than loaded whole
+_CHUNKED_READ_BYTES = 512 * 1024 * 1024
+_CSV_CHUNKSIZE = 200_000
+
+
+# pd.read_csv's default NA spellings: Arrow's defaults plus "<NA>" and "None"
+_PA_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def _read_csv_arrow(path) -> pd.DataFrame:
+    # Memory-mapped file parsed block-parallel by Arrow, converted the way
+    # pd.read_csv(engine="pyarrow", dtype_backend="pyarrow") would (same NA values,
+    # empty strings as nulls), minus pandas' Python file handle in between
+    convert_options = pa_csv.ConvertOptions(null_values=_PA_NULL_VALUES, strings_can_be_null=True)
+    with pa.memory_map(os.fspath(path)) as src:
+        table = pa_csv.read_csv(
+            src, read_options=pa_csv.ReadOptions(use_threads=True), convert_options=convert_options
+        )
+    if len(set(table.column_names)) != len(table.column_names):
+        # Leave duplicate headers to pandas, which de-duplicates them ("a", "a.1")
+        raise ValueError("duplicate column names")
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def _parse_csv(source) -> pd.DataFrame:
+    # ``source`` is a path or a file-like object; a file-like one must be seekable to
+    # retry with the C engine after a pyarrow failure
+    is_path = isinstance(source, (str, os.PathLike))
+    start = source.tell() if not is_path and getattr(source, "seekable", lambda: False)() else None
+    if pa is not None and (is_path or start is not None):
+        # Multi-threaded Arrow parser with Arrow-backed columns (contiguous UTF-8 for .str ops)
+        try:
+            if is_path:
+                return _read_csv_arrow(source)
+            return pd.read_csv(source, engine="pyarrow", dtype_backend="pyarrow")
+        except Exception as e:
+            logger.debug("pyarrow CSV engine failed, falling back to the C engine: %s", e)
+            if start is not None:
+                source.seek(start)
+    return pd.read_csv(source)
+
+
+# Feather schema metadata key recording the (mtime_ns, size) of the CSV a sidecar was built from
+_FEATHER_SOURCE_KEY = b"aidmind.source"
+
+
+@lru_cache(maxsize=4)
+def _read_csv_cached(path: str, mtime_ns: int, size: int) -> pd.DataFrame:
+    # mtime/size are part of the cache key so an edited file is re-parsed.
+    # On disk, a binary Feather sidecar (<csv>.feather) skips CSV parsing on later
+    # runs; it records the same (mtime_ns, size) and is only used on an exact match,
+    # so a CSV swapped for an older copy (cp -p, rsync -t, git checkout) is re-parsed.
+    feather_path = path + ".feather"
+    source = json.dumps([mtime_ns, size]).encode()
+    if pa is not None and os.path.exists(feather_path):
+        try:
+            with pa.memory_map(feather_path) as src:
+                reader = pa.ipc.open_file(src)
+                if (reader.schema.metadata or {}).get(_FEATHER_SOURCE_KEY) == source:
+                    df = reader.read_all().to_pandas(types_mapper=pd.ArrowDtype)
+                    logger.info("Loaded dataset from cache: %s", feather_path)
+                    return df
+        except Exception as e:
+            logger.warning("Failed to read dataset cache, re-parsing CSV: %s", e)
+    df = _parse_csv(path)
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), _FEATHER_SOURCE_KEY: source})
+            # Written aside and renamed into place, so a crash or a concurrent run never
+            # leaves a truncated sidecar at the final path
+            part_path = f"{feather_path}.{os.getpid()}.part"
+            try:
+                pa_feather.write_feather(table, part_path)
+                os.replace(part_path, feather_path)
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+        except Exception as e:
+            logger.debug("Could not write dataset cache %s: %s", feather_path, e)
+    return df
+
+
+def _read_dataset(dataset_path: str) -> pd.DataFrame:
+    # Repeated runs on an unchanged CSV reuse the parsed frame; callers get a copy
+    # because analyze_needs mutates it in place.
+    st = os.stat(dataset_path)
+    return _read_csv_cached(os.path.abspath(dataset_path), st.st_mtime_ns, st.st_size).copy()
+
+
+def _iter_chunks(dataset_path: str, chunksize: int = _CSV_CHUNKSIZE):
+    # Lazily yield DataFrames of at most ``chunksize`` rows
+    yield from pd.read_csv(dataset_path, chunksize=chunksize)
+
+
+def _aggregate_chunks(chunks, id_col: str) -> pd.DataFrame:
+    # Streaming per-admin mean: accumulate partial sums/counts per chunk so peak memory
+    # is O(chunksize + admins). Keys and numeric columns match the in-memory path;
+    # numeric columns are fixed by the first chunk and later chunks coerced to numbers.
+    names, sums, counts, numeric_cols = [], [], [], None
+    for chunk in chunks:
+        if numeric_cols is None:
+            numeric_cols = [c for c in chunk.select_dtypes(include=[np.number, "bool"]).columns if c != id_col]
+        stripped = _strip_suffix_series(chunk[id_col])
+        keys = _normalize_series(stripped).to_numpy()
+        num = chunk[numeric_cols].apply(pd.to_numeric, errors="coerce")
+        names.append(pd.Series(stripped.to_numpy(), index=keys).groupby(level=0, sort=False).first())
+        sums.append(num.groupby(keys, sort=False).sum())
+        counts.append(num.notna().groupby(keys, sort=False).sum())
+    first_name = pd.concat(names).groupby(level=0, sort=False).first()
+    total = pd.concat(sums).groupby(level=0, sort=False).sum()
+    n = pd.concat(counts).groupby(level=0, sort=False).sum()
+    means = total / n.where(n > 0)
+    means.insert(0, id_col, first_name.reindex(means.index).to_numpy())
+    return means.reset_index(drop=True)
+
+
+def _downcast_features(df: pd.DataFrame, id_col: str) -> pd.DataFrame:
+    # Indicators are stored as float32: the scoring/standardization passes are
+    # memory-bound, so half the bytes per cell is roughly half the time
+    num_cols = [c for c in df.select_dtypes(include=["number", "bool"]).columns if c != id_col]
+    if num_cols:
+        df[num_cols] = df[num_cols].astype(np.float32)
+    return df
+
+
+def _prepare_features(df: pd.DataFrame, id_col: str) -> Tuple[pd.DataFrame, np.ndarray, pd.DataFrame]:
+    # Keep only numeric columns for ML features. Coerce once and treat a column as
+    # numeric when coercion introduced no new missing values (i.e. every value parsed).
+    candidate_cols = [c for c in df.columns if c != id_col]
+    coerced = df[candidate_cols].apply(pd.to_numeric, errors="coerce")
+    numeric_mask = (coerced.notna() | df[candidate_cols].isna()).all()
+    feature_cols = coerced.columns[numeric_mask.to_numpy()].tolist()
     if not feature_cols:
         raise ValueError("No numeric feature columns found in the dataset.")
 
-    # Coerce and clean
-    df_num = df[feature_cols].apply(pd.to_numeric, errors="coerce").replace([np.inf, -np.inf], np.nan)
+    # Clean
+    df_num = coerced[feature_cols].replace([np.inf, -np.inf], np.nan)
 
     # Drop columns that are entirely NaN
     all_nan_cols = [c for c in df_num.columns if df_num[c].isna().all()]
@@ -158,10 +643,16 @@ def _prepare_features(df: pd.DataFrame, id_col: str) -> Tuple[pd.DataFrame, np.n
         if not feature_cols:
             raise ValueError("All numeric feature columns are empty (NaN).")
 
-    # Impute missing values with median
-    nan_before = int(df_num.isna().sum().sum())
-    imputer = SimpleImputer(strategy="median")
-    X_imp = imputer.fit_transform(df_num)
+    # Impute missing values with the column median (one masked write, no estimator).
+    # Stay in float32 when every feature already is; mixed inputs fall back to float64.
+    dtype = np.float32 if (df_num.dtypes == np.float32).all() else np.float64
+    X_imp = df_num.to_numpy(dtype=dtype, copy=True)
+    missing = np.isnan(X_imp)
+    nan_before = int(missing.sum())
+    if nan_before > 0:
+        medians = np.nanmedian(X_imp, axis=0)
+        rows, cols = np.nonzero(missing)
+        X_imp[rows, cols] = medians[cols]
     nan_after = int(np.isnan(X_imp).sum())
     if nan_before > 0:
         logger.info("Imputed %d missing values in features (median).", nan_before)
@@ -169,18 +660,87 @@ def _prepare_features(df: pd.DataFrame, id_col: str) -> Tuple[pd.DataFrame, np.n
         # This should not happen unless columns were all-NaN; guard anyway
         raise ValueError("Missing values remain after imputation; please check your dataset.")
 
-    scaler = StandardScaler()
-    Xs = scaler.fit_transform(X_imp)
-    features_scaled = pd.DataFrame(Xs, columns=feature_cols, index=df.index)
+    # Standardize in place (same as StandardScaler: population std, zero std -> 1);
+    # the moments are accumulated in float64 whatever the storage dtype. X_imp is
+    # column-major, so each column is streamed contiguously: center first, then take
+    # the variance from the centered buffer with einsum (no squared temporary and no
+    # second mean pass, unlike ndarray.std)
+    Xs = X_imp
+    mu = Xs.mean(axis=0, dtype=np.float64)
+    Xs -= mu
+    sigma = np.sqrt(np.einsum("ij,ij->j", Xs, Xs, dtype=np.float64) / Xs.shape[0])
+    sigma[sigma == 0] = 1.0
+    Xs /= sigma
+    features_scaled = pd.DataFrame(Xs, columns=feature_cols, index=df.index, copy=False)
     return df[[id_col]], Xs, features_scaled
 
 
+# Below this many cells the numba JIT/import cost outweighs the fused kernel
+_NUMBA_MIN_CELLS = 250_000
+
+
+@lru_cache(maxsize=None)
+def _need_kernel():
+    # Built lazily so importing aidmind never pays for numba; None if numba is missing
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, cache=True)
+    def kernel(X):
+        # Fused row-mean (NaN-skipping) + 0..1 min-max over the means, one output allocation.
+        # Rows are independent, so both passes over them are spread across cores.
+        n, m = X.shape
+        out = np.empty(n, dtype=np.float64)
+        for i in prange(n):
+            acc = 0.0
+            cnt = 0
+            for j in range(m):
+                v = X[i, j]
+                if v == v:
+                    acc += v
+                    cnt += 1
+            out[i] = acc / cnt if cnt else np.nan
+        lo = np.inf
+        hi = -np.inf
+        for i in range(n):
+            if out[i] < lo:
+                lo = out[i]
+            if out[i] > hi:
+                hi = out[i]
+        if hi > lo:
+            rng = hi - lo
+            for i in prange(n):
+                out[i] = (out[i] - lo) / rng
+        else:
+            out[:] = 0.0
+        return out
+
+    return kernel
+
+
 def _compute_need_scores(features_scaled: pd.DataFrame) -> np.ndarray:
     # Unsupervised proxy: average of standardized indicators. Higher => more needy
-    scores = features_scaled.mean(axis=1).values
-    # Normalize 0..1
-    if scores.max() > scores.min():
-        scores = (scores - scores.min()) / (scores.max() - scores.min())
+    if features_scaled.size >= _NUMBA_MIN_CELLS:
+        kernel = _need_kernel()
+        if kernel is not None:
+            return kernel(features_scaled.to_numpy(copy=False))
+    # float32 features are read as-is; the row means are accumulated and returned in float64
+    arr = features_scaled.to_numpy(copy=False)
+    if arr.dtype != np.float32:
+        arr = arr.astype(np.float64, copy=False)
+    scores = arr.mean(axis=1, dtype=np.float64)
+    if np.isnan(scores).any():
+        # Match DataFrame.mean's NaN skipping only when a row actually has gaps
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            scores = np.nanmean(arr, axis=1, dtype=np.float64)
+    # Normalize 0..1 in place (one min/max reduction each)
+    lo, hi = scores.min(), scores.max()
+    if hi > lo:
+        scores -= lo
+        scores /= hi - lo
     else:
         scores = np.zeros_like(scores)
     return scores
@@ -192,14 +752,45 @@ def _cluster_and_rank(Xs: np.ndarray, need_scores: np.ndarray, max_clusters: int
         labels = np.zeros(n, dtype=int)
         return labels, {0: 0}
     k = min(max_clusters, max(3, min(5, n)))
-    km = KMeans(n_clusters=k, n_init=10, random_state=42)
+    # k-means++ seeding makes a single init sufficient here; the labels only feed a rank map
+    if n < 500:
+        km = KMeans(n_clusters=k, init="k-means++", n_init=1, random_state=42, algorithm="lloyd")
+    else:
+        km = MiniBatchKMeans(n_clusters=k, n_init=1, batch_size=256, random_state=42)
     labels = km.fit_predict(Xs)
-    cluster_means = {c: float(need_scores[labels == c].mean()) for c in range(k)}
-    ranked = sorted(cluster_means.items(), key=lambda x: x[1], reverse=True)
-    rank_map = {cluster_id: rank for rank, (cluster_id, _) in enumerate(ranked)}
+    sums = np.bincount(labels, weights=need_scores, minlength=k)
+    counts = np.bincount(labels, minlength=k)
+    cluster_means = sums / np.maximum(counts, 1)
+    ranked = np.argsort(-cluster_means, kind="stable")
+    rank_map = dict(zip(ranked.tolist(), range(k)))
     return labels, rank_map
 
 
+# Discrete need levels from lowest to highest need; index = np.digitize bin over (q25, q50, q75)
+_LEVEL_NAMES = np.array(["lowest", "low", "high", "highest"], dtype=object)
+_LEVEL_COLORS = np.array(["#16a34a", "#86efac", "#f87171", "#b91c1c"], dtype=object)
+_UNKNOWN_LEVEL = "unknown"
+_UNKNOWN_COLOR = "#cccccc"
+_FEATURE_STYLE = {"fillOpacity": 0.8, "weight": 0.5, "color": "#666666"}
+
+
+def _need_levels(values: np.ndarray, thresholds: Tuple[float, float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    # Vectorized level/color lookup; NaN values map to "unknown"
+    values = np.asarray(values, dtype=np.float64)
+    q25, q50, q75 = thresholds
+    if q25 <= q50 <= q75:
+        bins = np.digitize(values, thresholds)
+    else:
+        # np.digitize needs monotonic bins; mirror the >= cascade for unordered fixed thresholds
+        bins = np.select([values >= q75, values >= q50, values >= q25], [3, 2, 1], default=0)
+    names = _LEVEL_NAMES[bins]
+    colors = _LEVEL_COLORS[bins]
+    unknown = np.isnan(values)
+    names[unknown] = _UNKNOWN_LEVEL
+    colors[unknown] = _UNKNOWN_COLOR
+    return names, colors
+
+
 def _merge_with_geojson(df: pd.DataFrame, id_col: str, geojson: dict) -> Tuple[pd.DataFrame, dict, str, str]:
     # Determine which GeoJSON property holds the geographic name to join on.
     features = geojson.get("features", [])
@@ -239,13 +830,15 @@ def _merge_with_geojson(df: pd.DataFrame, id_col: str, geojson: dict) -> Tuple[p
                 f["properties"] = props
 
     # Normalize names in both datasets
-    df = df.copy()
     if "__norm_name" not in df.columns:
-        df["__norm_name"] = df[id_col].astype(str).map(_normalize_name)
+        df = df.assign(__norm_name=_normalize_series(df[id_col]))
 
-    for f in features:
+    feature_norm_names = _normalize_series([f.get("properties", {}).get(gj_name_key, "") for f in features])
+    # Single pass over the features: normalized join name plus feature index for folium
+    for i, (f, norm) in enumerate(zip(features, feature_norm_names.tolist())):
         props = f.get("properties", {})
-        props["__norm_name"] = _normalize_name(props.get(gj_name_key, ""))
+        props["__norm_name"] = norm
+        props["__feature_index"] = i
         f["properties"] = props
 
     # Try direct merge on normalized name
@@ -257,15 +850,66 @@ def _merge_with_geojson(df: pd.DataFrame, id_col: str, geojson: dict) -> Tuple[p
     # Prefer 'shapeID' if present; else fall back to normalized name
     bind_key = "shapeID" if "shapeID" in gj_df.columns else "__norm_name"
 
-    # Build a lookup from feature bind_key -> feature index for folium
-    for i, f in enumerate(features):
-        f["properties"]["__feature_index"] = i
-
     return merged, geojson, bind_key, gj_name_key
 
 
+def _csv_read_error(dataset_path, e: Exception) -> ValueError:
+    return ValueError(
+        f"Failed to read CSV file: {dataset_path}\n"
+        f"Error: {e}\n"
+        f"Ensure the file is a valid CSV with proper encoding (UTF-8 recommended)."
+    )
+
+
+def _default_output_dir() -> str:
+    out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+    os.makedirs(out_dir, exist_ok=True)
+    return out_dir
+
+
+def _level_thresholds(values: np.ndarray, fixed_thresholds) -> Tuple[float, float, float]:
+    # Discrete color scheme by quartiles unless fixed thresholds were given
+    if fixed_thresholds is not None:
+        q25, q50, q75 = fixed_thresholds
+    elif values.size:
+        q25, q50, q75 = np.quantile(values, [0.25, 0.5, 0.75])
+    else:
+        q25 = q50 = q75 = 0.0
+    return (q25, q50, q75)
+
+
+def _export_scores(
+    scored: pd.DataFrame,
+    id_col: str,
+    thresholds: Tuple[float, float, float],
+    out_dir: str,
+    iso3: Optional[str],
+    export_csv: bool,
+) -> Tuple[Optional[str], pd.DataFrame]:
+    # Build the scores table and (optionally) write it to needs_scores_<ISO3>.csv in
+    # out_dir; returns (csv path or None, table)
+    # compute level for each row using its score
+    levels, _ = _need_levels(scored["need_score"].to_numpy(dtype=np.float64), thresholds)
+    # Use generic column name that works for any level
+    geo_col_name = id_col if id_col else "geographic_unit"
+    export_df = scored[["__norm_name", "need_score", "need_rank", "cluster"]].rename(columns={"__norm_name": geo_col_name})
+    export_df["need_level"] = levels
+    csv_out = None
+    if export_csv:
+        try:
+            # Generate CSV output path
+            suffix = iso3 if iso3 else "custom"
+            csv_out = os.path.join(out_dir, f"needs_scores_{suffix}.csv")
+            _write_csv(export_df, csv_out)
+            logger.info("Exported scores to: %s", csv_out)
+        except Exception as e:
+            logger.warning("Could not export CSV: %s", e)
+            csv_out = None
+    return csv_out, export_df
+
+
 def analyze_needs(
-    dataset_path: str,
+    dataset_path: Union[str, os.PathLike, IO[str], IO[bytes]],
     country_name: Optional[str] = None,
     output_html_path: Optional[str] = None,
     *,
@@ -273,7 +917,10 @@ def analyze_needs(
     admin_col: Optional[str] = None,
     local_geojson: Optional[str] = None,
     fixed_thresholds: Optional[Tuple[float, float, float]] = None,
-) -> str:
+    return_df: bool = False,
+    export_csv: bool = True,
+    generate_map: bool = True,
+) -> Union[Optional[str], Tuple[Optional[str], pd.DataFrame]]:
     """
     Analyze humanitarian need using unsupervised learning and render a geographic map.
     
@@ -282,8 +929,9 @@ def analyze_needs(
 
     Parameters
     ----------
-    dataset_path : str
-        Path to a CSV with geographic units and indicators.
+    dataset_path : str, os.PathLike or file-like
+        Path to a CSV with geographic units and indicators, or an open text/binary
+        file-like object (e.g. io.StringIO) holding the CSV contents.
     country_name : Optional[str]
         Country name (e.g., "Afghanistan"). Required only if fetching boundaries from GeoBoundaries.
         Can be None if you provide local_geojson.
@@ -299,11 +947,23 @@ def analyze_needs(
         become optional. Use this for villages, custom zones, or offline analysis.
     fixed_thresholds : Optional[Tuple[float, float, float]]
         Fixed thresholds (q25, q50, q75) for color levels. If None, uses quartiles.
+    return_df : bool
+        If True, also return the scores table (the same columns as the exported CSV).
+    export_csv : bool
+        Write the scores table to needs_scores_<ISO3>.csv next to the HTML. Set to False
+        with return_df=True to keep the results in memory only.
+    generate_map : bool
+        If False, skip boundaries, name harmonization and the HTML map and only score
+        the dataset. country_name/local_geojson are then optional (country_name only
+        names the CSV; blank or unresolvable names give needs_scores_custom.csv), and
+        the CSV goes next to output_html_path or to output/.
 
     Returns
     -------
-    str
-        Path to the generated HTML file.
+    str or (str, pandas.DataFrame)
+        Path to the generated HTML file, or (path, scores) when return_df is True.
+        With generate_map=False the path is that of the scores CSV (None if
+        export_csv is False).
 
     Raises
     ------
@@ -326,17 +986,20 @@ def analyze_needs(
     # Custom zones (refugee camps, neighborhoods, etc.)
     analyze_needs("camps.csv", local_geojson="camp_boundaries.geojson", admin_col="camp_name")
     """
-    # Validate inputs
-    if not dataset_path:
+    # Validate argument shapes first so bad calls fail before any filesystem access
+    is_path = isinstance(dataset_path, (str, os.PathLike))
+    if dataset_path is None or (is_path and not dataset_path):
         raise ValueError("dataset_path cannot be empty.")
-    if not os.path.exists(dataset_path):
-        raise FileNotFoundError(
-            f"Dataset not found: {dataset_path}\n"
-            f"Please check the file path and ensure the file exists."
+    
+    # (scores-only runs use the country just to name the CSV, so a blank one is fine there)
+    if generate_map and isinstance(country_name, str) and not country_name.strip() and not local_geojson:
+        raise ValueError(
+            "country_name cannot be empty.\n"
+            "Provide a country name (e.g., 'Afghanistan') or local_geojson for custom boundaries."
         )
     
-    # Check if we have either country_name OR local_geojson
-    if not country_name and not local_geojson:
+    # Check if we have either country_name OR local_geojson (boundaries are only needed for the map)
+    if generate_map and not country_name and not local_geojson:
         raise ValueError(
             "Must provide either country_name (for GeoBoundaries) or local_geojson (for custom boundaries).\n"
             "Examples:\n"
@@ -344,12 +1007,6 @@ def analyze_needs(
             "  - With custom boundaries: local_geojson='villages.geojson'"
         )
     
-    if local_geojson and not os.path.exists(local_geojson):
-        raise FileNotFoundError(
-            f"local_geojson not found: {local_geojson}\n"
-            f"Please check the file path and ensure the GeoJSON exists."
-        )
-    
     # Validate admin_level only if using GeoBoundaries
     if country_name and not local_geojson:
         if not admin_level:
@@ -368,14 +1025,33 @@ def analyze_needs(
         if not all(isinstance(t, (int, float)) for t in fixed_thresholds):
             raise ValueError("All threshold values must be numeric.")
 
+    # Then check the files exist
+    if is_path and not os.path.exists(dataset_path):
+        raise FileNotFoundError(
+            f"Dataset not found: {dataset_path}\n"
+            f"Please check the file path and ensure the file exists."
+        )
+    
+    if local_geojson and not os.path.exists(local_geojson):
+        raise FileNotFoundError(
+            f"local_geojson not found: {local_geojson}\n"
+            f"Please check the file path and ensure the GeoJSON exists."
+        )
+
+    # Very large CSVs are streamed in chunks and aggregated incrementally (see below);
+    # only the first chunk is held for validation and admin column detection
+    chunks = None
     try:
-        df = pd.read_csv(dataset_path)
+        if not is_path:
+            # File-like input: parse directly, nothing to stat or cache
+            df = _parse_csv(dataset_path)
+        elif os.path.getsize(dataset_path) > _CHUNKED_READ_BYTES:
+            chunks = _iter_chunks(dataset_path)
+            df = next(chunks, pd.DataFrame())
+        else:
+            df = _read_dataset(dataset_path)
     except Exception as e:
-        raise ValueError(
-            f"Failed to read CSV file: {dataset_path}\n"
-            f"Error: {e}\n"
-            f"Ensure the file is a valid CSV with proper encoding (UTF-8 recommended)."
-        )
+        raise _csv_read_error(dataset_path, e)
     
     if df.empty:
         raise ValueError(
@@ -407,31 +1083,41 @@ def analyze_needs(
 
     logger.info("Detected admin column: %s", id_col)
     # Aggregate multiple rows per admin by stripping trailing numeric suffixes
-    try:
-        before_n = int(df[id_col].nunique())
-        df[id_col] = df[id_col].astype(str).map(_strip_suffix_unit)
-        # Average numeric indicators per admin
-        numeric_cols = [c for c in df.columns if c != id_col and pd.api.types.is_numeric_dtype(df[c])]
-        if numeric_cols:
-            df = (
-                df[[id_col] + numeric_cols]
-                .groupby(id_col, as_index=False)
-                .mean(numeric_only=True)
-            )
-        after_n = int(df[id_col].nunique())
-        if after_n < before_n:
-            logger.info("Aggregated multiple rows per admin: %d -> %d unique", before_n, after_n)
-    except Exception as e:
-        logger.warning("Aggregation step failed; proceeding without aggregation: %s", e)
+    if chunks is not None:
+        try:
+            # Later chunks are only parsed here, so their errors surface like the first one's
+            df = _aggregate_chunks(itertools.chain([df], chunks), id_col)
+        except Exception as e:
+            raise _csv_read_error(dataset_path, e)
+        logger.info("Aggregated streamed dataset to %d unique admins", len(df))
+    else:
+        try:
+            before_n = int(df[id_col].nunique())
+            df[id_col] = _strip_suffix_series(df[id_col])
+            # Average numeric indicators per admin in one groupby, keyed on the normalized
+            # name so spelling variants that join to the same boundary are combined. The key
+            # is categorical so groupby hashes each distinct name once and then works on codes.
+            numeric_cols = df.select_dtypes(include=[np.number, "bool"]).columns.tolist()
+            if numeric_cols:
+                df = (
+                    df.assign(_key=_normalize_series(df[id_col]).astype("category"))
+                    .groupby("_key", sort=False, observed=True, as_index=False)
+                    .agg({id_col: "first", **{c: "mean" for c in numeric_cols}})
+                    .drop(columns="_key")
+                )
+            after_n = int(df[id_col].nunique())
+            if after_n < before_n:
+                logger.info("Aggregated multiple rows per admin: %d -> %d unique", before_n, after_n)
+        except Exception as e:
+            logger.warning("Aggregation step failed; proceeding without aggregation: %s", e)
 
+    df = _downcast_features(df, id_col)
     id_df, Xs, features_scaled = _prepare_features(df, id_col)
     need_scores = _compute_need_scores(features_scaled)
     labels, rank_map = _cluster_and_rank(Xs, need_scores)
 
     # Attach results
-    result_df = id_df.copy()
-    result_df["need_score"] = need_scores
-    result_df["cluster"] = labels
+    result_df = id_df.assign(need_score=need_scores, cluster=labels)
     result_df["need_rank"] = result_df["cluster"].map(rank_map)
 
     # Fetch boundaries
@@ -440,13 +1126,26 @@ def analyze_needs(
         try:
             iso3 = _country_to_iso3(country_name)
         except Exception as e:
-            if not local_geojson:
+            if not generate_map:
+                logger.warning("Could not resolve country name, naming outputs 'custom': %s", e)
+            elif not local_geojson:
                 raise ValueError(
                     f"Could not resolve country name '{country_name}' to ISO3 code: {e}\n"
                     f"Check spelling or provide local_geojson instead."
                 )
-            logger.warning("Could not resolve country name, using local_geojson only: %s", e)
-    
+            else:
+                logger.warning("Could not resolve country name, using local_geojson only: %s", e)
+
+    if not generate_map:
+        # Scores only: no boundaries, fuzzy harmonization against them, or map rendering
+        scored = result_df.assign(__norm_name=_normalize_series(result_df[id_col]))
+        thresholds = _level_thresholds(scored["need_score"].to_numpy(dtype=np.float64), fixed_thresholds)
+        out_dir = os.path.dirname(os.path.abspath(output_html_path)) if output_html_path else _default_output_dir()
+        csv_out, export_df = _export_scores(scored, id_col, thresholds, out_dir, iso3, export_csv)
+        if return_df:
+            return csv_out, export_df
+        return csv_out
+
     if local_geojson:
         # Use local boundaries directly
         geojson = _fetch_admin1_geojson(
@@ -470,26 +1169,17 @@ def analyze_needs(
                 name_key = key
                 break
         if name_key:
-            geo_names = [
-                _normalize_name(f.get("properties", {}).get(name_key, ""))
-                for f in features
-            ]
+            geo_names = _normalize_series(
+                [f.get("properties", {}).get(name_key, "") for f in features]
+            ).tolist()
             # build normalization column to map
-            df_res = result_df.copy()
-            df_res["__norm_name"] = df_res[id_col].astype(str).map(_normalize_name)
-            mapped = []
-            for nm in df_res["__norm_name"].tolist():
-                if nm in geo_names:
-                    mapped.append(nm)
-                else:
-                    # closest match
-                    match = difflib.get_close_matches(nm, geo_names, n=1, cutoff=0.84)
-                    mapped.append(match[0] if match else nm)
+            norm_names = _normalize_series(result_df[id_col]).tolist()
+            mapped = _closest_names(norm_names, geo_names, cutoff=0.84)
             # only set mapping if it improves coverage
-            before_cov = sum(n in geo_names for n in df_res["__norm_name"]) / max(len(df_res), 1)
-            after_cov = sum(n in geo_names for n in mapped) / max(len(mapped), 1)
+            geo_name_set = set(geo_names)
+            before_cov = sum(n in geo_name_set for n in norm_names) / max(len(norm_names), 1)
+            after_cov = sum(n in geo_name_set for n in mapped) / max(len(mapped), 1)
             if after_cov > before_cov:
-                result_df = result_df.copy()
                 result_df["__norm_name"] = mapped
                 logger.info("Applied fuzzy name harmonization: coverage %.1f%% -> %.1f%%", before_cov*100, after_cov*100)
     except Exception as e:
@@ -510,28 +1200,7 @@ def analyze_needs(
 
     # Prepare map
     # Center map roughly at country centroid (avg of feature centroids)
-    try:
-        # Compute centroid average from GeoJSON
-        # Fallback to (0,0) if fails
-        import shapely.geometry as geom  # optional; may not be installed
-        import shapely.ops as ops
-        from functools import reduce
-        coords = []
-        for f in geojson.get("features", []):
-            geom_obj = f.get("geometry")
-            if not geom_obj:
-                continue
-            g = geom.shape(geom_obj)
-            c = g.representative_point().coords[0]
-            coords.append(c)
-        if coords:
-            avg_lat = float(np.mean([c[1] for c in coords]))
-            avg_lon = float(np.mean([c[0] for c in coords]))
-            map_center = (avg_lat, avg_lon)
-        else:
-            map_center = (0.0, 0.0)
-    except Exception:
-        map_center = (0.0, 0.0)
+    map_center = _load_map_center(geojson, None if local_geojson else _geojson_cache_path(iso3))
 
     m = folium.Map(location=map_center, zoom_start=5, tiles="cartodbpositron")
 
@@ -540,61 +1209,32 @@ def analyze_needs(
     colormap.caption = "Need (red = highest)"
 
     # Build value mapping keyed by bind key
-    value_by_key = {}
-    rank_by_key = {}
-    for _, row in merged.iterrows():
-        key = row.get(bind_key)
-        if pd.isna(key):
-            key = row.get("__norm_name")
-        value_by_key[str(key)] = float(row["need_score"]) if not pd.isna(row["need_score"]) else 0.0
-        rank_by_key[str(key)] = int(row["need_rank"]) if not pd.isna(row["need_rank"]) else 0
+    keys = merged[bind_key].where(merged[bind_key].notna(), merged["__norm_name"]).astype(str).to_numpy()
+    value_by_key = dict(zip(keys, merged["need_score"].fillna(0.0).astype(float).tolist()))
+    rank_by_key = dict(zip(keys, merged["need_rank"].fillna(0).astype(int).tolist()))
 
     # Discrete color scheme by quartiles
     values = np.array([v for v in value_by_key.values() if v is not None])
-    if fixed_thresholds is not None:
-        q25, q50, q75 = fixed_thresholds
-    elif values.size:
-        q25, q50, q75 = np.quantile(values, [0.25, 0.5, 0.75])
-    else:
-        q25 = q50 = q75 = 0.0
-
-    def level_for(val: Optional[float]) -> Tuple[str, str]:
-        # returns (level_name, hex_color)
-        if val is None:
-            return ("unknown", "#cccccc")
-        if val >= q75:
-            return ("highest", "#b91c1c")  # highest need
-        elif val >= q50:
-            return ("high", "#f87171")  # middle need
-        elif val >= q25:
-            return ("low", "#86efac")  # low need
-        else:
-            return ("lowest", "#16a34a")  # lowest need
+    thresholds = _level_thresholds(values, fixed_thresholds)
 
     # Attach values into GeoJSON properties for tooltips (always set keys to avoid assertion)
-    for f in geojson.get("features", []):
-        props = f.get("properties", {})
-        key = str(props.get(bind_key) or props.get("__norm_name"))
-        val = value_by_key.get(key)
+    # (_merge_with_geojson guarantees every feature has a properties dict)
+    props_list = [f["properties"] for f in geojson.get("features", [])]
+    feature_keys = [str(p.get(bind_key) or p.get("__norm_name")) for p in props_list]
+    feature_vals = np.array([value_by_key.get(k, np.nan) for k in feature_keys], dtype=np.float64)
+    feature_levels, feature_colors = _need_levels(feature_vals, thresholds)
+    for props, key, val, lvl, hex_color in zip(
+        props_list, feature_keys, feature_vals.tolist(), feature_levels.tolist(), feature_colors.tolist()
+    ):
         rnk = rank_by_key.get(key)
-        props["__need_score"] = round(float(val), 3) if val is not None else "N/A"
+        props["__need_score"] = round(val, 3) if not np.isnan(val) else "N/A"
         props["__need_rank"] = int(rnk) if rnk is not None else "N/A"
-        lvl, hex_color = level_for(val)
         props["__need_level"] = lvl
         props["__need_color"] = hex_color
-        f["properties"] = props
 
     def style_function(feature):
-        props = feature.get("properties", {})
-        key = str(props.get(bind_key) or props.get("__norm_name"))
-        val = value_by_key.get(key)
-        _, color = level_for(val)
-        return {
-            "fillOpacity": 0.8,
-            "weight": 0.5,
-            "color": "#666666",
-            "fillColor": color,
-        }
+        # Colors were stamped into the properties above; no lookup per feature here
+        return {**_FEATURE_STYLE, "fillColor": feature["properties"].get("__need_color", _UNKNOWN_COLOR)}
 
     folium.GeoJson(
         geojson,
@@ -628,31 +1268,17 @@ def analyze_needs(
         pass
 
     if output_html_path is None:
-        out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
-        os.makedirs(out_dir, exist_ok=True)
         # Use ISO3 if available, otherwise generic name
         suffix = iso3 if iso3 else "custom"
-        output_html_path = os.path.join(out_dir, f"needs_map_{suffix}.html")
+        output_html_path = os.path.join(_default_output_dir(), f"needs_map_{suffix}.html")
 
     m.save(output_html_path)
-    try:
-        # Generate CSV output path
-        suffix = iso3 if iso3 else "custom"
-        csv_out = os.path.join(os.path.dirname(output_html_path), f"needs_scores_{suffix}.csv")
-        # compute level for each merged row using its score
-        levels = []
-        for _, row in merged.iterrows():
-            val = float(row["need_score"]) if not pd.isna(row["need_score"]) else None
-            lvl, _ = level_for(val)
-            levels.append(lvl)
-        # Use generic column name that works for any level
-        geo_col_name = id_col if id_col else "geographic_unit"
-        export_df = merged[["__norm_name", "need_score", "need_rank", "cluster"]].rename(columns={"__norm_name": geo_col_name})
-        export_df["need_level"] = levels
-        export_df.to_csv(csv_out, index=False)
-        logger.info("Exported scores to: %s", csv_out)
-    except Exception as e:
-        logger.warning("Could not export CSV: %s", e)
+
+    _, export_df = _export_scores(
+        merged, id_col, thresholds, os.path.dirname(output_html_path), iso3, export_csv
+    )
+    if return_df:
+        return output_html_path, export_df
     return output_html_path
 
 
@@ -670,6 +1296,8 @@ def main():
                        help="Name of geographic unit column in CSV")
     parser.add_argument("--geojson", dest="geojson", default=None,
                        help="Path to local GeoJSON boundaries file")
+    parser.add_argument("--no-map", dest="generate_map", action="store_false",
+                       help="Only score the dataset and write the CSV (no boundaries or HTML map)")
     args = parser.parse_args()
 
     out = analyze_needs(
@@ -678,7 +1306,8 @@ def main():
         args.output,
         admin_level=args.admin_level,
         admin_col=args.admin_col,
-        local_geojson=args.geojson
+        local_geojson=args.geojson,
+        generate_map=args.generate_map,
     )
     print(out)
 
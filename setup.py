@@ -54,6 +54,14 @@ setup(
             "flake8>=6.0",
             "mypy>=1.0",
         ],
+        "fast": [
+            "rapidfuzz>=3.0",
+            "orjson>=3.9",
+            "pyarrow>=14.0",
+        ],
+        "jit": [
+            "numba>=0.58",
+        ],
         "notebook": [
             "jupyter>=1.0",
             "notebook>=6.5",
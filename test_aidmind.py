@@ -5,15 +5,22 @@ Unit tests for AidMind
 import pytest
 import pandas as pd
 import numpy as np
+import io
 import os
 import tempfile
+import time
 import json
 from aidmind import (
     analyze_needs,
     _detect_admin_column,
     _normalize_name,
+    _normalize_series,
     _strip_suffix_unit,
+    _strip_suffix_series,
     _compute_need_scores,
+    _closest_names,
+    _need_levels,
+    _aggregate_chunks,
 )
 
 
@@ -66,12 +73,55 @@ class TestNameNormalization:
         """Test collapsing multiple spaces"""
         assert _normalize_name("Valle  del   Cauca") == "valle del cauca"
     
+    def test_series_matches_scalar(self):
+        """Test vectorized normalization matches the scalar helper"""
+        names = ["Kabul", "  Herat  ", "Sar-e Pol", "Valle  del   Cauca", "Badakhshan@#$"]
+        assert _normalize_series(names).tolist() == [_normalize_name(n) for n in names]
+    
     def test_suffix_stripping(self):
         """Test stripping numeric suffixes"""
         assert _strip_suffix_unit("Kabul_1") == "Kabul"
         assert _strip_suffix_unit("Herat-2") == "Herat"
         assert _strip_suffix_unit("Kandahar_10") == "Kandahar"
         assert _strip_suffix_unit("Balkh") == "Balkh"
+    
+    def test_suffix_stripping_series(self):
+        """Test vectorized suffix stripping matches the scalar helper"""
+        names = pd.Series(["Kabul_1", "Herat-2", " Kandahar_10 ", "Balkh", "Sar-e  Pol"])
+        assert _strip_suffix_series(names).tolist() == [_strip_suffix_unit(n) for n in names]
+    
+    def test_series_non_ascii_and_index(self):
+        """Test non-ASCII names and missing values match the scalar helpers, index kept"""
+        ascii_names = pd.Series(["Kabul_1", None, "Herat\t-2"], index=[7, 8, 9])
+        mixed_names = pd.Series(["Kābul_1", None, "Herat\u00a0 -2"], index=[7, 8, 9])
+        for names in (ascii_names, mixed_names):
+            stripped = _strip_suffix_series(names)
+            assert stripped.index.tolist() == [7, 8, 9]
+            assert stripped.tolist() == [_strip_suffix_unit(str(n)) if n else "nan" for n in names]
+            assert _normalize_series(names).tolist() == [_normalize_name(str(n)) if n else "nan" for n in names]
+
+
+class TestNameMatching:
+    """Tests for fuzzy name harmonization"""
+    
+    def test_closest_names(self):
+        """Test exact, close and unmatched names"""
+        choices = ["kabul", "kandahar", "sarepul"]
+        mapped = _closest_names(["kabul", "kandahr", "sarepol", "xyz"], choices)
+        assert mapped == ["kabul", "kandahar", "sarepul", "xyz"]
+    
+    def test_no_choices(self):
+        """Test names are unchanged without candidates"""
+        assert _closest_names(["kabul"], []) == ["kabul"]
+    
+    def test_matches_difflib(self):
+        """Test results (including ties) equal difflib.get_close_matches with or without rapidfuzz"""
+        import difflib
+        choices = ["kabula", "kabulb", "kandahar", "sarepul", "herat"]
+        names = ["kabulx", "kandhar", "sar e pul", "herrat", "ghor"]
+        expected = [(difflib.get_close_matches(n, choices, n=1, cutoff=0.8) or [n])[0] for n in names]
+        assert _closest_names(names, choices, cutoff=0.8) == expected
+        assert expected[0] == "kabulb"  # difflib keeps the greatest of equally close names
 
 
 class TestNeedScoring:
@@ -100,6 +150,318 @@ class TestNeedScoring:
         
         # All scores should be equal (and 0 after normalization)
         assert np.allclose(scores, 0.0)
+    
+    def test_float32_features(self):
+        """Test float32 indicators score like float64 and return float64 scores"""
+        df = pd.DataFrame(np.random.RandomState(0).rand(20, 3))
+        scores = _compute_need_scores(df.astype(np.float32))
+        assert scores.dtype == np.float64
+        assert np.allclose(scores, _compute_need_scores(df), atol=1e-6)
+    
+    def test_numba_kernel_matches_pandas(self):
+        """Test the fused numba kernel agrees with the pandas path"""
+        pytest.importorskip("numba")
+        from aidmind import _need_kernel
+        df = pd.DataFrame(np.random.RandomState(0).randn(50, 4))
+        assert np.allclose(_need_kernel()(df.to_numpy()), _compute_need_scores(df))
+    
+    def test_need_levels(self):
+        """Test discrete level binning against thresholds"""
+        values = np.array([0.1, 0.25, 0.5, 0.8, np.nan])
+        levels, colors = _need_levels(values, (0.25, 0.5, 0.75))
+        assert list(levels) == ["lowest", "low", "high", "highest", "unknown"]
+        assert colors[-1] == "#cccccc"
+
+
+class TestChunkedAggregation:
+    """Tests for streaming aggregation of large CSVs"""
+    
+    def test_chunks_match_full_mean(self):
+        """Test partial sums/counts across chunks give the per-admin mean"""
+        chunks = [
+            pd.DataFrame({"province": ["Kabul_1", "Herat_1"], "health": [0.8, 0.6]}),
+            pd.DataFrame({"province": ["Kabul_2", "Herat_2"], "health": [0.7, np.nan]}),
+        ]
+        result = _aggregate_chunks(iter(chunks), "province")
+        assert result["province"].tolist() == ["Kabul", "Herat"]
+        assert np.allclose(result["health"], [0.75, 0.6])
+    
+    def test_bool_indicators_kept(self):
+        """Test True/False indicator columns are averaged like 1/0 in both aggregation paths"""
+        rows = [("Kabul_1", True, 0.5), ("kabul-2", False, 0.7), ("Herat", False, 0.6),
+                ("Balkh", True, 0.2), ("Ghor", False, 0.9)]
+        as_bool = "province,has_clinic,health\n" + "".join(f"{p},{b},{h}\n" for p, b, h in rows)
+        as_int = "province,has_clinic,health\n" + "".join(f"{p},{int(b)},{h}\n" for p, b, h in rows)
+        chunked = _aggregate_chunks(iter([pd.read_csv(io.StringIO(as_bool))]), "province")
+        assert chunked["has_clinic"].tolist() == [0.5, 0.0, 1.0, 0.0]
+        _, with_bool = analyze_needs(io.StringIO(as_bool), generate_map=False, return_df=True, export_csv=False)
+        _, with_int = analyze_needs(io.StringIO(as_int), generate_map=False, return_df=True, export_csv=False)
+        pd.testing.assert_frame_equal(with_bool, with_int)
+    
+    def test_bad_later_chunk_raises_value_error(self, monkeypatch):
+        """Test a parse error past the first chunk gets the same error as a small file"""
+        import aidmind
+        monkeypatch.setattr(aidmind, "_CHUNKED_READ_BYTES", 0)
+        monkeypatch.setattr(aidmind, "_iter_chunks", lambda path: pd.read_csv(path, chunksize=2))
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
+            f.write("province,health\nKabul,0.8\nHerat,0.6\nBalkh,0.5\nGhor,0.4,extra,fields\n")
+            temp_csv = f.name
+        try:
+            with pytest.raises(ValueError, match="Failed to read CSV file"):
+                analyze_needs(temp_csv, "Afghanistan", generate_map=False, export_csv=False)
+        finally:
+            os.unlink(temp_csv)
+
+
+class TestCsvReading:
+    """Tests for the Arrow CSV reader and writer"""
+    
+    def test_writer_matches_to_csv(self):
+        """Test whole floats keep their decimal point and NaN is written empty, as in to_csv"""
+        from aidmind import _write_csv
+        df = pd.DataFrame({
+            "province": ["kabul", "herat", "balkh"],
+            "need_score": [1.0, np.nan, 0.123456789],
+            "need_rank": [0, 1, 2],
+        })
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "scores.csv")
+            _write_csv(df, path)
+            with open(path) as f:
+                assert f.read() == df.to_csv(index=False)
+    
+    def test_matches_pandas_pyarrow_engine(self):
+        """Test NA spellings, empty cells and dtypes match pd.read_csv(engine='pyarrow')"""
+        pytest.importorskip("pyarrow")
+        from aidmind import _read_csv_arrow
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
+            f.write("province,health,note\nKabul,0.8,None\nHerat,NA,\n\"Kan,dahar\",1e3,<NA>\n")
+            temp_csv = f.name
+        try:
+            expected = pd.read_csv(temp_csv, engine="pyarrow", dtype_backend="pyarrow")
+            pd.testing.assert_frame_equal(_read_csv_arrow(temp_csv), expected)
+        finally:
+            os.unlink(temp_csv)
+
+
+class TestDatasetCache:
+    """Tests for the on-disk Feather sidecar of parsed CSVs"""
+    
+    def test_sidecar_rejected_for_older_replacement(self):
+        """Test a CSV replaced by a same-size file with an older mtime is re-parsed"""
+        pytest.importorskip("pyarrow")
+        from aidmind import _read_dataset, _read_csv_cached
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "data.csv")
+            with open(path, "w") as f:
+                f.write("province,value\nKabul,1\nHerat,2\n")
+            os.utime(path, (2000, 2000))
+            assert _read_dataset(path)["value"].tolist() == [1, 2]
+            assert os.path.exists(path + ".feather")
+            with open(path, "w") as f:
+                f.write("province,value\nKabul,9\nHerat,2\n")
+            os.utime(path, (1000, 1000))
+            _read_csv_cached.cache_clear()
+            assert _read_dataset(path)["value"].tolist() == [9, 2]
+
+
+class TestJsonIO:
+    """Tests for the orjson/json readers"""
+    
+    def test_nan_tokens_accepted(self):
+        """Test GeoJSON written by json.dump with NaN/Infinity still loads (orjson rejects them)"""
+        from aidmind import _fetch_admin1_geojson, _loads_json
+        data = {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"name": "Kabul", "pop": float("nan"), "area": float("inf")},
+             "geometry": {"type": "Point", "coordinates": [69.2, 34.5]}},
+        ]}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "custom.geojson")
+            with open(path, "w") as f:
+                json.dump(data, f)
+            loaded = _fetch_admin1_geojson("CUSTOM", admin_level="CUSTOM", local_path=path)
+            props = loaded["features"][0]["properties"]
+            assert props["name"] == "Kabul"
+            assert np.isnan(props["pop"]) and props["area"] == float("inf")
+            with open(path, "rb") as f:
+                assert _loads_json(f.read())["features"][0]["properties"]["name"] == "Kabul"
+
+
+class _FakeResponse:
+    """Minimal stand-in for a streamed requests.Response"""
+    
+    def __init__(self, status_code=200, body=b"", headers=None, error=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = body
+        self._error = error
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_content(self, chunk_size):
+        yield self.content
+        if self._error is not None:
+            raise self._error
+
+
+class _FakeSession:
+    """Session returning canned responses (or raising) and recording each request"""
+    
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+    
+    def get(self, url, headers=None, **kwargs):
+        self.calls.append((url, dict(headers or {})))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestGeoJsonDownload:
+    """Tests for streaming GeoJSON downloads into the cache"""
+    
+    def test_network_error_mid_stream_propagates(self, monkeypatch):
+        """Test a dropped connection is raised, not retried as a cache-write failure"""
+        import requests
+        import aidmind
+        error = requests.exceptions.ChunkedEncodingError("connection dropped")
+        session = _FakeSession(_FakeResponse(body=b'{"type": "FeatureCollection", ', error=error))
+        monkeypatch.setattr(aidmind, "_SESSION", session)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = os.path.join(temp_dir, "AFG_ADM1.geojson")
+            with pytest.raises(requests.exceptions.ChunkedEncodingError):
+                aidmind._download_geojson("https://example.invalid/afg.geojson", cache_path)
+            assert [url for url, _ in session.calls] == ["https://example.invalid/afg.geojson"]
+            assert os.listdir(temp_dir) == []
+
+
+class TestGeoJsonRevalidation:
+    """Tests for ETag re-validation of cached GeoJSON boundaries"""
+    
+    URL = "https://example.invalid/afg.geojson"
+    OLD = {"type": "FeatureCollection", "features": [], "version": 1}
+    NEW = {"type": "FeatureCollection", "features": [], "version": 2}
+    
+    def _setup_cache(self, monkeypatch, temp_dir, session, age):
+        import aidmind
+        cache_path = os.path.join(temp_dir, "AFG_ADM1.geojson")
+        with open(cache_path, "w") as f:
+            json.dump(self.OLD, f)
+        meta = {"url": self.URL, "etag": '"v1"', "last_modified": None, "checked": time.time() - age}
+        with open(aidmind._cache_meta_path(cache_path), "w") as f:
+            json.dump(meta, f)
+        monkeypatch.setattr(aidmind, "_geojson_cache_path", lambda iso3: cache_path)
+        monkeypatch.setattr(aidmind, "_SESSION", _FakeSession())
+        monkeypatch.setattr(aidmind, "_REVALIDATE_SESSION", session)
+        return cache_path
+    
+    def _meta(self, cache_path):
+        import aidmind
+        with open(aidmind._cache_meta_path(cache_path)) as f:
+            return json.load(f)
+    
+    def test_fresh_cache_makes_no_request(self, monkeypatch):
+        """Test a cache within the TTL is used without any network call"""
+        import aidmind
+        session = _FakeSession()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._setup_cache(monkeypatch, temp_dir, session, age=60)
+            assert aidmind._fetch_admin1_geojson("AFG") == self.OLD
+            assert session.calls == []
+    
+    def test_not_modified_keeps_cache(self, monkeypatch):
+        """Test a 304 answer serves the cache and restarts the TTL"""
+        import aidmind
+        session = _FakeSession(_FakeResponse(status_code=304))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = self._setup_cache(monkeypatch, temp_dir, session, age=aidmind._GEOJSON_CACHE_TTL + 60)
+            assert aidmind._fetch_admin1_geojson("AFG") == self.OLD
+            assert session.calls == [(self.URL, {"If-None-Match": '"v1"'})]
+            assert time.time() - self._meta(cache_path)["checked"] < 60
+    
+    def test_modified_replaces_cache(self, monkeypatch):
+        """Test a 200 answer replaces the cached body and stores the new ETag"""
+        import aidmind
+        session = _FakeSession(_FakeResponse(body=json.dumps(self.NEW).encode(), headers={"ETag": '"v2"'}))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path = self._setup_cache(monkeypatch, temp_dir, session, age=aidmind._GEOJSON_CACHE_TTL + 60)
+            assert aidmind._fetch_admin1_geojson("AFG") == self.NEW
+            with open(cache_path) as f:
+                assert json.load(f) == self.NEW
+            assert self._meta(cache_path)["etag"] == '"v2"'
+    
+    def test_network_error_uses_cache_and_restarts_ttl(self, monkeypatch):
+        """Test an unreachable server falls back to the cache once, then waits a full TTL"""
+        import requests
+        import aidmind
+        session = _FakeSession(requests.exceptions.ConnectionError("refused"))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._setup_cache(monkeypatch, temp_dir, session, age=aidmind._GEOJSON_CACHE_TTL + 60)
+            assert aidmind._fetch_admin1_geojson("AFG") == self.OLD
+            assert aidmind._fetch_admin1_geojson("AFG") == self.OLD
+            assert len(session.calls) == 1
+
+
+class TestMapCenter:
+    """Tests for the map center and its centroid sidecar"""
+    
+    GEOJSON = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [[[60, 30], [70, 30], [70, 36], [60, 30]]]}},
+    ]}
+    
+    def _paths(self, temp_dir):
+        cache_path = os.path.join(temp_dir, "AFG_ADM1.geojson")
+        with open(cache_path, "w") as f:
+            json.dump(self.GEOJSON, f)
+        return cache_path, os.path.join(temp_dir, "AFG_ADM1_centroids.json")
+    
+    def test_fresh_sidecar_reused(self):
+        """Test a sidecar at least as new as the GeoJSON cache is returned as-is"""
+        from aidmind import _load_map_center
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path, sidecar = self._paths(temp_dir)
+            assert _load_map_center(self.GEOJSON, cache_path) == (33.0, 65.0)
+            with open(sidecar) as f:
+                assert json.load(f) == {"center": [33.0, 65.0]}
+            with open(sidecar, "w") as f:
+                json.dump({"center": [1.0, 2.0]}, f)
+            assert _load_map_center(self.GEOJSON, cache_path) == (1.0, 2.0)
+    
+    def test_stale_sidecar_recomputed(self):
+        """Test a sidecar older than the GeoJSON cache is recomputed and rewritten"""
+        from aidmind import _load_map_center
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path, sidecar = self._paths(temp_dir)
+            with open(sidecar, "w") as f:
+                json.dump({"center": [1.0, 2.0]}, f)
+            os.utime(sidecar, (1000, 1000))
+            assert _load_map_center(self.GEOJSON, cache_path) == (33.0, 65.0)
+            with open(sidecar) as f:
+                assert json.load(f) == {"center": [33.0, 65.0]}
+    
+    def test_corrupt_sidecar_recomputed(self):
+        """Test an unreadable sidecar falls back to computing the center"""
+        from aidmind import _load_map_center
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_path, sidecar = self._paths(temp_dir)
+            with open(sidecar, "w") as f:
+                f.write("{not json")
+            assert _load_map_center(self.GEOJSON, cache_path) == (33.0, 65.0)
+
+
+@pytest.fixture(scope="session")
+def tiny_csv():
+    """Minimal valid CSV text shared by the validation tests (wrap in io.StringIO per call)"""
+    return "province,value\nKabul,0.5\n"
 
 
 class TestInputValidation:
@@ -110,46 +472,27 @@ class TestInputValidation:
         with pytest.raises(FileNotFoundError):
             analyze_needs("nonexistent.csv", "Afghanistan")
     
-    def test_empty_country_name(self):
+    def test_empty_country_name(self, tiny_csv):
         """Test error with empty country name"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("province,value\nKabul,0.5\n")
-            temp_path = f.name
-        
-        try:
-            with pytest.raises(ValueError, match="country_name cannot be empty"):
-                analyze_needs(temp_path, "")
-        finally:
-            os.unlink(temp_path)
+        with pytest.raises(ValueError, match="country_name cannot be empty"):
+            analyze_needs(io.StringIO(tiny_csv), "")
     
-    def test_invalid_admin_level(self):
-        """Test error with invalid admin level"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("province,value\nKabul,0.5\n")
-            temp_path = f.name
-        
-        try:
-            with pytest.raises(ValueError, match="Invalid admin_level"):
-                analyze_needs(temp_path, "Afghanistan", admin_level="ADM3")
-        finally:
-            os.unlink(temp_path)
+    def test_invalid_admin_level(self, tiny_csv):
+        """Test error with a blank or non-string admin level (any level name, e.g. ADM3, is accepted)"""
+        with pytest.raises(ValueError, match="admin_level must be a non-empty string"):
+            analyze_needs(io.StringIO(tiny_csv), "Afghanistan", admin_level="   ")
+        with pytest.raises(ValueError, match="admin_level must be a non-empty string"):
+            analyze_needs(io.StringIO(tiny_csv), "Afghanistan", admin_level=3)
     
-    def test_invalid_thresholds(self):
+    def test_invalid_thresholds(self, tiny_csv):
         """Test error with invalid fixed thresholds"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("province,value\nKabul,0.5\n")
-            temp_path = f.name
+        # Wrong number of thresholds
+        with pytest.raises(ValueError, match="must be a tuple/list of 3 floats"):
+            analyze_needs(io.StringIO(tiny_csv), "Afghanistan", fixed_thresholds=(0.5,))
         
-        try:
-            # Wrong number of thresholds
-            with pytest.raises(ValueError, match="must be a tuple/list of 3 floats"):
-                analyze_needs(temp_path, "Afghanistan", fixed_thresholds=(0.5,))
-            
-            # Non-numeric thresholds
-            with pytest.raises(ValueError, match="must be numeric"):
-                analyze_needs(temp_path, "Afghanistan", fixed_thresholds=("a", "b", "c"))
-        finally:
-            os.unlink(temp_path)
+        # Non-numeric thresholds
+        with pytest.raises(ValueError, match="must be numeric"):
+            analyze_needs(io.StringIO(tiny_csv), "Afghanistan", fixed_thresholds=("a", "b", "c"))
 
 
 class TestEndToEnd:
@@ -157,64 +500,92 @@ class TestEndToEnd:
     
     def test_basic_workflow(self):
         """Test complete workflow with minimal dataset"""
-        # Create temporary CSV
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("province,health,education,income\n")
-            f.write("Kabul,0.8,0.9,0.7\n")
-            f.write("Kandahar,0.4,0.3,0.5\n")
-            f.write("Herat,0.6,0.7,0.6\n")
-            f.write("Balkh,0.5,0.6,0.5\n")
-            temp_csv = f.name
-        
-        # Create temporary output directory
+        # Inputs and outputs share one temporary directory, so the <csv>.feather
+        # dataset cache written next to the CSV is removed with it
         with tempfile.TemporaryDirectory() as temp_dir:
+            temp_csv = os.path.join(temp_dir, "data.csv")
+            with open(temp_csv, "w") as f:
+                f.write("province,health,education,income\n")
+                f.write("Kabul,0.8,0.9,0.7\n")
+                f.write("Kandahar,0.4,0.3,0.5\n")
+                f.write("Herat,0.6,0.7,0.6\n")
+                f.write("Balkh,0.5,0.6,0.5\n")
             output_html = os.path.join(temp_dir, "test_map.html")
             
-            try:
-                # Run analysis
-                result_path = analyze_needs(
-                    dataset_path=temp_csv,
-                    country_name="Afghanistan",
-                    output_html_path=output_html,
-                )
-                
-                # Verify outputs exist
-                assert os.path.exists(result_path)
-                assert result_path == output_html
-                
-                # Check CSV export
-                csv_path = os.path.join(temp_dir, "needs_scores_AFG.csv")
-                if os.path.exists(csv_path):
-                    df = pd.read_csv(csv_path)
-                    assert "need_score" in df.columns
-                    assert "need_level" in df.columns
-                    assert len(df) > 0
-                
-            finally:
-                os.unlink(temp_csv)
+            # Run analysis, keeping the scores in memory
+            result_path, df = analyze_needs(
+                dataset_path=temp_csv,
+                country_name="Afghanistan",
+                output_html_path=output_html,
+                return_df=True,
+                export_csv=False,
+            )
+            
+            # Verify outputs exist
+            assert os.path.exists(result_path)
+            assert result_path == output_html
+            
+            # Check returned scores (no CSV written)
+            assert "need_score" in df.columns
+            assert "need_level" in df.columns
+            assert len(df) > 0
+            assert not os.path.exists(os.path.join(temp_dir, "needs_scores_AFG.csv"))
     
     def test_aggregation(self):
-        """Test that duplicate admin names are aggregated"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-            f.write("province,health,education\n")
-            f.write("Kabul_1,0.8,0.9\n")
-            f.write("Kabul_2,0.7,0.8\n")
-            f.write("Herat_1,0.6,0.7\n")
-            f.write("Herat_2,0.5,0.6\n")
-            temp_csv = f.name
-        
+        """Test that duplicate admin names (suffix, case and punctuation variants) are aggregated"""
         with tempfile.TemporaryDirectory() as temp_dir:
+            temp_csv = os.path.join(temp_dir, "data.csv")
+            with open(temp_csv, "w") as f:
+                f.write("province,health,education\n")
+                f.write("Kabul_1,0.8,0.9\n")
+                f.write("kabul-2,0.7,0.8\n")
+                f.write("Herat_1,0.6,0.7\n")
+                f.write("HERAT_2,0.5,0.6\n")
+                f.write("Balkh,0.2,0.4\n")
             output_html = os.path.join(temp_dir, "test_agg.html")
             
-            try:
-                result_path = analyze_needs(
-                    dataset_path=temp_csv,
-                    country_name="Afghanistan",
-                    output_html_path=output_html,
+            result_path = analyze_needs(
+                dataset_path=temp_csv,
+                country_name="Afghanistan",
+                output_html_path=output_html,
+            )
+            assert os.path.exists(result_path)
+            
+            # Variants are averaged into one row each, scoring like the pre-averaged data
+            _, df = analyze_needs(temp_csv, generate_map=False, return_df=True, export_csv=False)
+            averaged = "province,health,education\nKabul,0.75,0.85\nHerat,0.55,0.65\nBalkh,0.2,0.4\n"
+            _, expected = analyze_needs(io.StringIO(averaged), generate_map=False, return_df=True, export_csv=False)
+            assert df["province"].tolist() == ["kabul", "herat", "balkh"]
+            assert np.allclose(df["need_score"], expected["need_score"])
+            assert df["need_level"].tolist() == expected["need_level"].tolist()
+    
+    def test_scores_only(self):
+        """Test generate_map=False scores without boundaries or an HTML map"""
+        csv_text = "province,health,education\nKabul,0.8,0.9\nKandahar,0.4,0.3\nHerat,0.6,0.7\n"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_html = os.path.join(temp_dir, "test_map.html")
+            csv_path, df = analyze_needs(
+                io.StringIO(csv_text),
+                output_html_path=output_html,
+                generate_map=False,
+                return_df=True,
+            )
+            assert not os.path.exists(output_html)
+            assert csv_path == os.path.join(temp_dir, "needs_scores_custom.csv")
+            assert pd.read_csv(csv_path).shape == df.shape
+            assert df["province"].tolist() == ["kabul", "kandahar", "herat"]
+            assert df["need_score"].max() == 1.0
+    
+    def test_scores_only_ignores_country(self):
+        """Test generate_map=False accepts a blank or unknown country and names the CSV 'custom'"""
+        csv_text = "province,health\nKabul,0.8\nKandahar,0.4\nHerat,0.6\n"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_html = os.path.join(temp_dir, "test_map.html")
+            for country in ("", "Not A Country"):
+                csv_path = analyze_needs(
+                    io.StringIO(csv_text), country, output_html_path=output_html, generate_map=False
                 )
-                assert os.path.exists(result_path)
-            finally:
-                os.unlink(temp_csv)
+                assert csv_path == os.path.join(temp_dir, "needs_scores_custom.csv")
 
 
 if __name__ == "__main__":